@@ -1,31 +1,86 @@
 import os
+import sys
+from dataclasses import dataclass
+from argon2 import PasswordHasher
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from dotenv import load_dotenv
 
-load_dotenv()
+# FLASK_SKIP_DOTENV is the same switch the flask CLI honours
+if not os.getenv("FLASK_SKIP_DOTENV"):
+    load_dotenv()
+
+@dataclass(frozen=True, slots=True)
+class _Config:
+    secret_key: str
+    database_url: str
+    track_modifications: bool = False
+
+# environment is read once per process, not on every create_app() call
+_CONFIG = _Config(
+    secret_key=os.getenv("SECRET_KEY", "dev-secret-key"),
+    # DATABASE_URL (Postgres) expected in env; fallback to sqlite for local quick test
+    database_url=os.getenv("DATABASE_URL", "sqlite:///habitflow.db"),
+)
 
 db = SQLAlchemy()
-migrate = Migrate()
 login_manager = LoginManager()
 login_manager.login_view = "routes.login"
 login_manager.login_message_category = "info"
 
+# argon2 cost; memory cost is in KiB
+_PASSWORD_HASH_DEFAULTS = {
+    "PASSWORD_HASH_TIME_COST": 2,
+    "PASSWORD_HASH_MEMORY_COST": 64 * 1024,
+    "PASSWORD_HASH_PARALLELISM": 1,
+}
+
+def _password_hasher(config):
+    return PasswordHasher(
+        time_cost=config["PASSWORD_HASH_TIME_COST"],
+        memory_cost=config["PASSWORD_HASH_MEMORY_COST"],
+        parallelism=config["PASSWORD_HASH_PARALLELISM"],
+    )
+
+def _wants_migrate():
+    # Flask-Migrate (and alembic) is only needed by the `flask db` CLI commands
+    if os.getenv("FLASK_MIGRATE"):
+        return True
+    argv0 = sys.argv[0] if sys.argv else ""
+    prog = os.path.splitext(os.path.basename(argv0))[0]
+    return prog == "flask" or argv0.endswith(os.path.join("flask", "__main__.py"))
+
+def _init_migrate(app):
+    from flask_migrate import Migrate
+    Migrate(app, db)
+
 def create_app(config=None, *args, **kwargs):
     app = Flask(__name__, template_folder="templates", static_folder="static")
-    app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret-key")
-    # DATABASE_URL (Postgres) expected in env; fallback to sqlite for local quick test
-    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///habitflow.db")
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SECRET_KEY"] = _CONFIG.secret_key
+    app.config["SQLALCHEMY_DATABASE_URI"] = _CONFIG.database_url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = _CONFIG.track_modifications
+    app.config.update(_PASSWORD_HASH_DEFAULTS)
 
     # Allow tests or callers to override config
     if config:
         app.config.update(config)
 
+    # keep warm, health-checked connections for server databases; Flask-SQLAlchemy
+    # already gives in-memory sqlite a StaticPool
+    if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {
+            "pool_size": 10,
+            "max_overflow": 20,
+            "pool_recycle": 1800,
+            "pool_pre_ping": True,
+        })
+
+    app.extensions["password_hasher"] = _password_hasher(app.config)
+
     db.init_app(app)
-    migrate.init_app(app, db)
+    if _wants_migrate():
+        _init_migrate(app)
     login_manager.init_app(app)
 
     # Blueprints - for simplicity we'll register routes directly here
@@ -2,20 +2,26 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField
 from wtforms.validators import DataRequired, Email, EqualTo, Length
 
+# validators hold no per-request state, so one instance is shared by every field
+_REQUIRED = DataRequired()
+_EMAIL = Email()
+
+FREQUENCY_CHOICES = [("daily", "Daily"), ("weekly", "Weekly")]
+
 class SignupForm(FlaskForm):
-    name = StringField("Full name", validators=[DataRequired(), Length(max=120)])
-    email = StringField("Email", validators=[DataRequired(), Email()])
-    password = PasswordField("Password", validators=[DataRequired(), Length(min=6)])
-    confirm = PasswordField("Confirm password", validators=[DataRequired(), EqualTo("password")])
+    name = StringField("Full name", validators=[_REQUIRED, Length(max=120)])
+    email = StringField("Email", validators=[_REQUIRED, _EMAIL])
+    password = PasswordField("Password", validators=[_REQUIRED, Length(min=6)])
+    confirm = PasswordField("Confirm password", validators=[_REQUIRED, EqualTo("password")])
     submit = SubmitField("Sign Up")
 
 class LoginForm(FlaskForm):
-    email = StringField("Email", validators=[DataRequired(), Email()])
-    password = PasswordField("Password", validators=[DataRequired()])
+    email = StringField("Email", validators=[_REQUIRED, _EMAIL])
+    password = PasswordField("Password", validators=[_REQUIRED])
     submit = SubmitField("Log In")
 
 class HabitForm(FlaskForm):
-    name = StringField("Habit name", validators=[DataRequired(), Length(max=140)])
+    name = StringField("Habit name", validators=[_REQUIRED, Length(max=140)])
     description = TextAreaField("Description", validators=[Length(max=1000)])
-    frequency = SelectField("Frequency", choices=[("daily", "Daily"), ("weekly", "Weekly")], validators=[DataRequired()])
+    frequency = SelectField("Frequency", choices=FREQUENCY_CHOICES, validators=[_REQUIRED])
     submit = SubmitField("Save")
@@ -1,8 +1,20 @@
-from datetime import date
-from . import db, login_manager
+from datetime import date, timedelta
+from . import db, login_manager, _PASSWORD_HASH_DEFAULTS, _password_hasher
+from flask import current_app, has_app_context
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import UniqueConstraint
+from werkzeug.security import check_password_hash
+from argon2.exceptions import InvalidHashError, VerificationError
+from sqlalchemy import UniqueConstraint, bindparam, case, func, inspect, select
+
+_LEGACY_SCHEMES = ("pbkdf2", "scrypt")
+# used outside an app context, e.g. by seed or admin scripts
+_DEFAULT_HASHER = _password_hasher(_PASSWORD_HASH_DEFAULTS)
+
+def _hasher():
+    # inside an app, the one create_app() built from the PASSWORD_HASH_* settings
+    if has_app_context():
+        return current_app.extensions["password_hasher"]
+    return _DEFAULT_HASHER
 
 class User(UserMixin, db.Model):
     __tablename__ = "users"
@@ -11,17 +23,34 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(150), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
 
-    habits = db.relationship("Habit", backref="owner", cascade="all, delete-orphan", lazy="dynamic")
+    habits = db.relationship("Habit", backref="owner", cascade="all, delete-orphan", lazy="select")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = _hasher().hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        stored = self.password_hash or ""
+        if stored.startswith("$argon2"):
+            ph = _hasher()
+            try:
+                ph.verify(stored, password)
+            except (VerificationError, InvalidHashError):
+                return False
+            if ph.check_needs_rehash(stored):
+                self.set_password(password)
+            return True
+        # unknown or malformed schemes are rejected before running any KDF
+        if stored.partition(":")[0] not in _LEGACY_SCHEMES:
+            return False
+        # legacy Werkzeug hashes are upgraded to argon2 on successful login
+        if not check_password_hash(stored, password):
+            return False
+        self.set_password(password)
+        return True
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
 
 
 class Habit(db.Model):
@@ -31,14 +60,78 @@ class Habit(db.Model):
     name = db.Column(db.String(140), nullable=False)
     description = db.Column(db.Text)
     frequency = db.Column(db.String(20), default="daily")  # 'daily' or 'weekly'
+    # cached completion stats, kept in step by mark_completed()/unmark_completed();
+    # streak_current is the run of consecutive days ending on last_completed, except that
+    # it is 0 after unmarking a one-day run: last_completed then falls back to an older
+    # log at least two days earlier, so no new mark can extend that stored run
+    streak_current = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    total_completions = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_completed = db.Column(db.Date)
+
+    logs = db.relationship(
+        "HabitLog", backref="habit", cascade="all, delete-orphan", lazy="select",
+        order_by="desc(HabitLog.date_completed)",
+    )
+
+    @property
+    def completed_dates(self):
+        # built from the loaded logs collection; expired together with it on commit
+        return frozenset(log.date_completed for log in self.logs)
 
-    logs = db.relationship("HabitLog", backref="habit", cascade="all, delete-orphan", lazy="dynamic")
+    def streak_on(self, day):
+        """Consecutive completed days ending on ``day``; 0 if ``day`` is not completed."""
+        return self.streak_current if self.last_completed == day else 0
+
+    def mark_completed(self, day):
+        """Update the cached stats after a log for ``day`` has been inserted."""
+        cls = type(self)
+        # SQL-side expressions, so concurrent toggles cannot lose an increment
+        self.streak_current = case(
+            (cls.last_completed == day - timedelta(days=1), cls.streak_current + 1),
+            (cls.last_completed == day, cls.streak_current),
+            else_=1,
+        )
+        self.total_completions = cls.total_completions + 1
+        self.last_completed = day
+
+    def unmark_completed(self, day):
+        """Update the cached stats after the log for ``day`` (the latest one) has been deleted."""
+        cls = type(self)
+        # SET expressions all see the old row, so the checks below use the old streak
+        self.last_completed = case(
+            (cls.streak_current > 1, day - timedelta(days=1)),
+            else_=select(func.max(HabitLog.date_completed))
+            .where(HabitLog.habit_id == cls.id)
+            .scalar_subquery(),
+        )
+        self.streak_current = case((cls.streak_current > 1, cls.streak_current - 1), else_=0)
+        self.total_completions = cls.total_completions - 1
+
+    def recompute_stats(self):
+        """Rebuild the cached stats from the habit's logs."""
+        days = set(db.session.execute(_SEL_LOG_DATES, {"hid": self.id}).scalars())
+        self.total_completions = len(days)
+        self.last_completed = max(days, default=None)
+        streak = 0
+        day = self.last_completed
+        while day in days:
+            streak += 1
+            day -= timedelta(days=1)
+        self.streak_current = streak
+
+    def _logs_loaded(self):
+        return "logs" not in inspect(self).unloaded
 
     def completed_on(self, day):
-        return self.logs.filter_by(date_completed=day).first() is not None
+        if self._logs_loaded():
+            return day in self.completed_dates
+        # existence probe: fetch one id instead of hydrating the whole collection
+        return db.session.execute(_SEL_LOG_FOR_DAY, {"hid": self.id, "day": day}).scalar() is not None
 
     def completion_count(self):
-        return self.logs.count()
+        if self._logs_loaded():
+            return len(self.logs)
+        return db.session.execute(_SEL_LOG_COUNT, {"hid": self.id}).scalar()
 
 class HabitLog(db.Model):
     __tablename__ = "habit_logs"
@@ -46,6 +139,16 @@ class HabitLog(db.Model):
     habit_id = db.Column(db.Integer, db.ForeignKey("habits.id", ondelete="CASCADE"), nullable=False)
     date_completed = db.Column(db.Date, nullable=False)
 
+    # the unique index doubles as the lookup index for (habit_id, date_completed) queries
     __table_args__ = (
         UniqueConstraint('habit_id', 'date_completed', name='_habit_date_uc'),
     )
+
+# built once at import; executions only bind new parameter values
+_SEL_LOG_FOR_DAY = (
+    select(HabitLog.id)
+    .where(HabitLog.habit_id == bindparam("hid"), HabitLog.date_completed == bindparam("day"))
+    .limit(1)
+)
+_SEL_LOG_COUNT = select(func.count(HabitLog.id)).where(HabitLog.habit_id == bindparam("hid"))
+_SEL_LOG_DATES = select(HabitLog.date_completed).where(HabitLog.habit_id == bindparam("hid"))
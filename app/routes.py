@@ -1,43 +1,108 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_user, logout_user, current_user, login_required
 from . import db
 from .models import User, Habit, HabitLog
 from .forms import SignupForm, LoginForm, HabitForm
 from datetime import date
+from sqlalchemy import bindparam, delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
 
 bp = Blueprint("routes", __name__)
 
+# the habit page history only needs dates, so skip hydrating HabitLog objects
+_SEL_HISTORY = (
+    select(HabitLog.date_completed)
+    .where(HabitLog.habit_id == bindparam("hid"))
+    .order_by(HabitLog.date_completed.desc())
+    .limit(60)
+)
+
+_static_urls = {}
+
+@bp.app_template_global()
+def cached_url(endpoint):
+    """url_for() for endpoints without URL variables, memoized per script root."""
+    key = (request.script_root, endpoint)
+    url = _static_urls.get(key)
+    if url is None:
+        url = _static_urls[key] = url_for(endpoint)
+    return url
+
+
+_DIALECT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def _insert_log_stmt(dialect, habit_id, day):
+    """INSERT for one completion log; ON CONFLICT DO NOTHING RETURNING id where supported."""
+    dialect_insert = _DIALECT_INSERTS.get(dialect.name)
+    if dialect_insert is None:
+        # portable fallback: a duplicate surfaces as an IntegrityError instead
+        return insert(HabitLog).values(habit_id=habit_id, date_completed=day)
+    return (
+        dialect_insert(HabitLog)
+        .values(habit_id=habit_id, date_completed=day)
+        .on_conflict_do_nothing(index_elements=["habit_id", "date_completed"])
+        .returning(HabitLog.id)
+    )
+
+
+def _insert_log_if_missing(habit_id, day):
+    """Insert a completion log unless one exists; return the new id or None."""
+    dialect = db.session.get_bind().dialect
+    stmt = _insert_log_stmt(dialect, habit_id, day)
+    if dialect.name in _DIALECT_INSERTS:
+        return db.session.execute(stmt).scalar()
+    # the SAVEPOINT keeps a duplicate from aborting the surrounding transaction
+    try:
+        with db.session.begin_nested():
+            result = db.session.execute(stmt)
+    except IntegrityError:
+        return None
+    return result.inserted_primary_key[0]
+
+
+def _get_own_habit(habit_id):
+    """Load one of the current user's habits; other users' habits are a 404 too."""
+    return Habit.query.filter_by(id=habit_id, user_id=current_user.id).first_or_404()
+
+
 # --- auth ---
 @bp.route("/signup", methods=["GET", "POST"])
 def signup():
     if current_user.is_authenticated:
-        return redirect(url_for("routes.index"))
+        return redirect(cached_url("routes.index"))
     form = SignupForm()
     if form.validate_on_submit():
-        if User.query.filter_by(email=form.email.data).first():
-            flash("Email already registered.", "warning")
-            return render_template("signup.html", form=form)
         user = User(name=form.name.data, email=form.email.data)
         user.set_password(form.password.data)
         db.session.add(user)
-        db.session.commit()
+        # the unique email constraint decides; no SELECT-then-INSERT race
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash("Email already registered.", "warning")
+            return render_template("signup.html", form=form)
         flash("Account created — please log in.", "success")
-        return redirect(url_for("routes.login"))
+        return redirect(cached_url("routes.login"))
     return render_template("signup.html", form=form)
 
 @bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for("routes.index"))
+        return redirect(cached_url("routes.index"))
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user and user.check_password(form.password.data):
+            # persist a rehashed password, if check_password upgraded it
+            db.session.commit()
             login_user(user)
             flash("Logged in.", "success")
             next_page = request.args.get("next")
-            return redirect(next_page or url_for("routes.index"))
+            return redirect(next_page or cached_url("routes.index"))
         flash("Invalid email or password.", "danger")
     return render_template("login.html", form=form)
 
@@ -46,21 +111,20 @@ def login():
 def logout():
     logout_user()
     flash("Logged out.", "info")
-    return redirect(url_for("routes.login"))
+    return redirect(cached_url("routes.login"))
 
 # --- dashboard ---
 @bp.route("/")
 @bp.route("/dashboard")
 @login_required
 def index():
-    habits = current_user.habits.all()
     today = date.today()
-    # compute progress: is completed today
-    progress = []
-    for h in habits:
-        completed = h.completed_on(today)
-        total = h.completion_count()
-        progress.append({"habit": h, "completed_today": completed, "total": total})
+    # progress comes from the cached stats columns; no habit_logs access at all
+    habits = Habit.query.filter_by(user_id=current_user.id).order_by(Habit.id).all()
+    progress = [
+        {"habit": h, "completed_today": h.last_completed == today, "total": h.total_completions}
+        for h in habits
+    ]
     return render_template("index.html", progress=progress, today=today)
 
 # --- add habit ---
@@ -73,16 +137,14 @@ def add_habit():
         db.session.add(h)
         db.session.commit()
         flash("Habit added.", "success")
-        return redirect(url_for("routes.index"))
+        return redirect(cached_url("routes.index"))
     return render_template("add_edit_habit.html", form=form, title="Add Habit")
 
 # --- edit habit ---
 @bp.route("/habit/<int:habit_id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_habit(habit_id):
-    h = Habit.query.get_or_404(habit_id)
-    if h.owner != current_user:
-        abort(403)
+    h = _get_own_habit(habit_id)
     form = HabitForm(obj=h)
     if form.validate_on_submit():
         h.name = form.name.data
@@ -90,65 +152,49 @@ def edit_habit(habit_id):
         h.frequency = form.frequency.data
         db.session.commit()
         flash("Habit updated.", "success")
-        return redirect(url_for("routes.index"))
+        return redirect(cached_url("routes.index"))
     return render_template("add_edit_habit.html", form=form, title="Edit Habit")
 
 # --- delete habit ---
 @bp.route("/habit/<int:habit_id>/delete", methods=["POST"])
 @login_required
 def delete_habit(habit_id):
-    h = Habit.query.get_or_404(habit_id)
-    if h.owner != current_user:
-        abort(403)
+    h = _get_own_habit(habit_id)
     db.session.delete(h)
     db.session.commit()
     flash("Habit deleted.", "info")
-    return redirect(url_for("routes.index"))
+    return redirect(cached_url("routes.index"))
 
 # --- mark complete/uncomplete ---
 @bp.route("/habit/<int:habit_id>/toggle", methods=["POST"])
 @login_required
 def toggle_habit(habit_id):
-    h = Habit.query.get_or_404(habit_id)
-    if h.owner != current_user:
-        abort(403)
+    h = _get_own_habit(habit_id)
     today = date.today()
-    existing = h.logs.filter_by(date_completed=today).first()
-    if existing:
-        db.session.delete(existing)
+    # insert first; a conflict means today's log already exists, so toggle it off
+    if _insert_log_if_missing(h.id, today) is not None:
+        h.mark_completed(today)
         db.session.commit()
-        flash(f"Marked '{h.name}' incomplete for {today}.", "warning")
-        return redirect(url_for("routes.index"))
+        flash(f"Marked '{h.name}' complete for {today}.", "success")
     else:
-        log = HabitLog(habit_id=h.id, date_completed=today)
-        db.session.add(log)
-        try:
-            db.session.commit()
-            flash(f"Marked '{h.name}' complete for {today}.", "success")
-        except IntegrityError:
-            db.session.rollback()
-            flash("Already marked.", "info")
-    return redirect(url_for("routes.index"))
+        result = db.session.execute(
+            delete(HabitLog).where(HabitLog.habit_id == h.id, HabitLog.date_completed == today)
+        )
+        if result.rowcount:
+            h.unmark_completed(today)
+        db.session.commit()
+        flash(f"Marked '{h.name}' incomplete for {today}.", "warning")
+    return redirect(cached_url("routes.index"))
 
 # --- view habit details & history ---
 @bp.route("/habit/<int:habit_id>")
 @login_required
 def view_habit(habit_id):
-    h = Habit.query.get_or_404(habit_id)
-    if h.owner != current_user:
-        abort(403)
-    logs = h.logs.order_by(HabitLog.date_completed.desc()).limit(60).all()
-    # simple streak calculation (consecutive days including today)
-    streak = 0
-    from datetime import timedelta
-    check_day = date.today()
-    while True:
-        if h.logs.filter_by(date_completed=check_day).first():
-            streak += 1
-            check_day -= timedelta(days=1)
-        else:
-            break
-    return render_template("view_habit.html", habit=h, logs=logs, streak=streak)
+    h = _get_own_habit(habit_id)
+    days = db.session.execute(_SEL_HISTORY, {"hid": h.id}).scalars().all()
+    # current streak (consecutive days including today) is cached on the habit
+    streak = h.streak_on(date.today())
+    return render_template("view_habit.html", habit=h, days=days, streak=streak)
 
 # --- profile ---
 @bp.route("/profile")
@@ -1,8 +1,13 @@
 from datetime import date, timedelta
+from functools import lru_cache
 
 def today():
     return date.today()
 
+@lru_cache(maxsize=64)
+def _last_n_days(base, n):
+    return tuple(base - timedelta(days=i) for i in range(n))
+
 def last_n_days(n):
-    base = date.today()
-    return [base - timedelta(days=i) for i in range(n)]
+    # keyed on today's date, so the cached tuple rolls over at midnight
+    return _last_n_days(date.today(), n)
@@ -1,118 +1,256 @@
 """
 Pytest configuration and shared fixtures for HabitFlow tests.
 """
+import os
 import pytest
 from datetime import date
+from sqlalchemy import event
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
 from app import create_app, db
 from app.models import User, Habit, HabitLog
 
 
+# each xdist worker is its own process, so every worker gets a private in-memory database;
+# StaticPool hands every checkout the same connection, so all sessions see one database
+TEST_CONFIG = {
+    "TESTING": True,
+    "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+    "SQLALCHEMY_ENGINE_OPTIONS": {
+        "poolclass": StaticPool,
+        "connect_args": {"check_same_thread": False},
+    },
+    "WTF_CSRF_ENABLED": False,
+    # templates are compiled once; don't stat them again even if FLASK_DEBUG is set
+    "TEMPLATES_AUTO_RELOAD": False,
+    # cheapest valid argon2 parameters, so hashing stays real but costs microseconds
+    "PASSWORD_HASH_TIME_COST": 1,
+    "PASSWORD_HASH_MEMORY_COST": 8,
+    "PASSWORD_HASH_PARALLELISM": 1,
+    "SECRET_KEY": "test-secret-key-for-testing"
+}
+
+
+def _enable_sqlite_savepoints(engine):
+    """Let SQLAlchemy emit BEGIN itself so pysqlite SAVEPOINTs nest correctly."""
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
 @pytest.fixture(scope='session')
 def app():
-    """Create application for the tests."""
-    app = create_app()
-    app.config.update({
-        "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "WTF_CSRF_ENABLED": False,
-        "SECRET_KEY": "test-secret-key-for-testing"
-    })
-    
+    """Create application and schema once for the whole test session."""
+    app = create_app(TEST_CONFIG)
+
+    # compile every template up front so no test pays for a first render
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
     with app.app_context():
+        _enable_sqlite_savepoints(db.engine)
         db.create_all()
-        yield app
-        db.session.remove()
+
+    yield app
+
+    with app.app_context():
         db.drop_all()
 
 
-@pytest.fixture
-def _db(app):
-    """Create a fresh database for each test."""
+@pytest.fixture(scope='class')
+def _class_connection(app):
+    """A connection whose transaction spans one test class and is rolled back after it.
+
+    Class-scoped fixtures write their rows here, so every test in the class
+    shares them without rebuilding them per test.
+    """
     with app.app_context():
-        db.create_all()
-        yield db
+        connection = db.engine.connect()
+        transaction = connection.begin()
+
+    yield connection
+
+    transaction.rollback()
+    connection.close()
+
+
+@pytest.fixture(autouse=True)
+def db_session(app, _class_connection):
+    """Run each test inside a SAVEPOINT that is rolled back afterwards.
+
+    Commits made by the test or by the app only release a nested SAVEPOINT,
+    so the schema is never rebuilt between tests. ``join_transaction_mode``
+    starts a fresh SAVEPOINT after every commit or rollback, which replaces
+    the older ``after_transaction_end`` listener recipe.
+    """
+    with app.app_context():
+        savepoint = _class_connection.begin_nested()
+        app_session = db.session
+        db.session = scoped_session(
+            sessionmaker(bind=_class_connection, join_transaction_mode="create_savepoint")
+        )
+
+        yield db.session
+
         db.session.remove()
-        db.drop_all()
+        db.session = app_session
+        savepoint.rollback()
+
+
+@pytest.fixture(scope='session')
+def pg_app():
+    """The app against the Postgres database in TEST_DATABASE_URL, for postgres-marked tests."""
+    url = os.getenv("TEST_DATABASE_URL", "")
+    if not url.startswith("postgresql"):
+        pytest.skip("TEST_DATABASE_URL does not point at Postgres")
+    config = {key: value for key, value in TEST_CONFIG.items() if key != "SQLALCHEMY_ENGINE_OPTIONS"}
+    app = create_app({**config, "SQLALCHEMY_DATABASE_URI": url})
+
+    yield app
+
+    with app.app_context():
+        db.engine.dispose()
 
 
 @pytest.fixture
-def client(app, _db):
-    """A test client for the app."""
+def pg_db_session(pg_app):
+    """Like db_session, but on Postgres, where the schema is created inside the rolled-back transaction."""
+    with pg_app.app_context():
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        db.metadata.create_all(connection)
+        app_session = db.session
+        db.session = scoped_session(
+            sessionmaker(bind=connection, join_transaction_mode="create_savepoint")
+        )
+
+        yield db.session
+
+        db.session.remove()
+        db.session = app_session
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture
+def select_counter(db_session):
+    """Record the SELECT statements sent to the database, to catch N+1 regressions."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(db.engine, "before_cursor_execute", record)
+
+
+@pytest.fixture(scope='session')
+def _client(app):
+    """One test client reused by the whole session."""
     return app.test_client()
 
 
+@pytest.fixture
+def client(_client, app, db_session):
+    """A test client for the app, with no cookies left over from earlier tests."""
+    _client.delete_cookie(app.config["SESSION_COOKIE_NAME"])
+    return _client
+
+
 @pytest.fixture
 def runner(app):
     """A test CLI runner for the app."""
     return app.test_cli_runner()
 
 
-@pytest.fixture
-def test_user(app, _db):
-    """Create a test user in the database."""
-    with app.app_context():
+@pytest.fixture(scope='class')
+def test_user(app, _class_connection):
+    """Create a test user shared by every test in the class."""
+    with app.app_context(), Session(bind=_class_connection, join_transaction_mode="create_savepoint",
+                 expire_on_commit=False) as session:
         user = User(name="Test User", email="test@example.com")
         user.set_password("testpass123")
-        db.session.add(user)
-        db.session.commit()
-        
-        # Refresh to get ID
-        db.session.refresh(user)
-        user_id = user.id
-        
-        yield user
-        
-        # Cleanup
-        user = db.session.get(User, user_id)
-        if user:
-            db.session.delete(user)
-            db.session.commit()
+        session.add(user)
+        session.commit()
+    return user
+
+
+@pytest.fixture(scope='class')
+def two_users_with_habit(app, _class_connection):
+    """Create two users and a habit owned by the first, shared by every test in the class."""
+    with app.app_context(), Session(bind=_class_connection, join_transaction_mode="create_savepoint",
+                 expire_on_commit=False) as session:
+        owner = User(name="User One", email="user1@example.com")
+        owner.set_password("pass123")
+        other = User(name="User Two", email="user2@example.com")
+        other.set_password("pass123")
+        session.add_all([owner, other])
+        session.flush()
+
+        habit = Habit(
+            user_id=owner.id,
+            name="User1's Habit",
+            description="Private habit",
+            frequency="daily"
+        )
+        session.add(habit)
+        session.commit()
+    return owner, other, habit
+
+
+@pytest.fixture(scope='class')
+def _login_cookie(app, test_user):
+    """A signed session cookie for test_user, built once per class."""
+    # write Flask-Login's session keys directly instead of posting /login
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(test_user.id)
+        session["_fresh"] = True
+    return client.get_cookie(app.config["SESSION_COOKIE_NAME"]).value
 
 
 @pytest.fixture
-def logged_in_client(client, test_user):
+def logged_in_client(client, app, _login_cookie):
     """A test client with a logged-in user."""
-    client.post("/login", data={
-        "email": "test@example.com",
-        "password": "testpass123"
-    })
+    # restoring the cookie also drops flashes left by the previous test
+    client.set_cookie(app.config["SESSION_COOKIE_NAME"], _login_cookie)
     return client
 
 
 @pytest.fixture
-def sample_habit(app, test_user, _db):
+def sample_habit(test_user, db_session, _class_connection):
     """Create a sample habit for testing."""
-    with app.app_context():
+    # a non-expiring session keeps the committed attributes loaded, and merge(load=False)
+    # hands the habit to db.session as-is, so reading it back costs no SELECT
+    with Session(bind=_class_connection, join_transaction_mode="create_savepoint",
+                 expire_on_commit=False) as session:
         habit = Habit(
             user_id=test_user.id,
             name="Sample Habit",
             description="A test habit",
             frequency="daily"
         )
-        db.session.add(habit)
-        db.session.commit()
-        
-        db.session.refresh(habit)
-        habit_id = habit.id
-        
-        yield habit
-        
-        # Cleanup
-        habit = db.session.get(Habit, habit_id)
-        if habit:
-            db.session.delete(habit)
-            db.session.commit()
+        session.add(habit)
+        session.commit()
+    return db.session.merge(habit, load=False)
 
 
 @pytest.fixture
-def completed_habit(app, sample_habit, _db):
+def completed_habit(sample_habit, db_session):
     """Create a habit that's been completed today."""
-    with app.app_context():
-        log = HabitLog(
-            habit_id=sample_habit.id,
-            date_completed=date.today()
-        )
-        db.session.add(log)
-        db.session.commit()
-        
-        yield sample_habit
\ No newline at end of file
+    log = HabitLog(
+        habit_id=sample_habit.id,
+        date_completed=date.today()
+    )
+    db.session.add(log)
+    # keep the cached stats in step with the log, as the toggle route would
+    sample_habit.recompute_stats()
+    db.session.commit()
+
+    yield sample_habit
@@ -2,44 +2,21 @@
 Comprehensive test suite for HabitFlow application.
 Tests authentication, habit management, and core functionality.
 """
+import threading
 import pytest
 from datetime import date, timedelta
-from app import create_app, db
+from sqlalchemy import insert, text
+from sqlalchemy.dialects import mysql, postgresql
+from werkzeug.security import generate_password_hash
+from app import db, models, routes
 from app.models import User, Habit, HabitLog
+from app.utils import last_n_days
 
 
-@pytest.fixture(scope='function')
-def app():
-    """Create and configure a test app instance."""
-    test_app = create_app()
-    test_app.config.update({
-        "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "WTF_CSRF_ENABLED": False,
-        "SECRET_KEY": "test-secret-key"
-    })
-    
-    with test_app.app_context():
-        db.create_all()
-        yield test_app
-        db.session.remove()
-        db.drop_all()
-
-
-@pytest.fixture
-def client(app):
-    """Test client for the app."""
-    return app.test_client()
-
-
-@pytest.fixture
-def test_user(app):
-    """Create a test user."""
-    user = User(name="Test User", email="test@example.com")
-    user.set_password("testpass123")
-    db.session.add(user)
-    db.session.commit()
-    return user
+def flashed_messages(client):
+    """Return the flash messages waiting in the client's session."""
+    with client.session_transaction() as session:
+        return [message for _, message in session.get("_flashes", [])]
 
 
 # ============================================================================
@@ -53,7 +30,8 @@ class TestAuthentication:
         """Test signup page renders correctly."""
         response = client.get("/signup")
         assert response.status_code == 200
-        assert b"Sign up" in response.data or b"Create Account" in response.data
+        body = response.data
+        assert b"Sign up" in body or b"Create Account" in body
     
     def test_successful_signup(self, client):
         """Test user can sign up successfully."""
@@ -65,7 +43,8 @@ class TestAuthentication:
         }, follow_redirects=True)
         
         assert response.status_code == 200
-        assert b"Account created" in response.data or b"please log in" in response.data
+        body = response.data
+        assert b"Account created" in body or b"please log in" in body
         
         # Verify user was created in database
         user = User.query.filter_by(email="newuser@example.com").first()
@@ -81,13 +60,16 @@ class TestAuthentication:
             "confirm": "password123"
         }, follow_redirects=True)
         
-        assert b"already registered" in response.data.lower() or b"already" in response.data.lower()
+        body = response.data.lower()
+        assert b"already registered" in body or b"already" in body
+        assert User.query.filter_by(email="test@example.com").count() == 1
     
     def test_login_page_loads(self, client):
         """Test login page renders correctly."""
         response = client.get("/login")
         assert response.status_code == 200
-        assert b"Login" in response.data or b"Sign in" in response.data
+        body = response.data
+        assert b"Login" in body or b"Sign in" in body
     
     def test_successful_login(self, client, test_user):
         """Test user can log in successfully."""
@@ -97,7 +79,8 @@ class TestAuthentication:
         }, follow_redirects=True)
         
         assert response.status_code == 200
-        assert b"Logged in" in response.data or b"Dashboard" in response.data
+        body = response.data
+        assert b"Logged in" in body or b"Dashboard" in body
     
     def test_login_invalid_email(self, client):
         """Test login fails with invalid email."""
@@ -117,6 +100,13 @@ class TestAuthentication:
         
         assert b"Invalid" in response.data
     
+    @pytest.mark.parametrize("path", ["/dashboard", "/habit/new", "/profile"])
+    def test_pages_require_login(self, client, path):
+        """Test protected pages redirect to login when not authenticated."""
+        response = client.get(path)
+        assert response.status_code == 302
+        assert "/login" in response.headers["Location"]
+    
     def test_logout(self, client, test_user):
         """Test user can log out."""
         # Login first
@@ -128,7 +118,8 @@ class TestAuthentication:
         # Then logout
         response = client.get("/logout", follow_redirects=True)
         assert response.status_code == 200
-        assert b"Logged out" in response.data or b"Login" in response.data
+        body = response.data
+        assert b"Logged out" in body or b"Login" in body
 
 
 # ============================================================================
@@ -138,40 +129,52 @@ class TestAuthentication:
 class TestDashboard:
     """Test dashboard functionality."""
     
-    def test_dashboard_requires_login(self, client):
-        """Test dashboard redirects to login when not authenticated."""
-        response = client.get("/dashboard", follow_redirects=True)
-        assert b"Login" in response.data or b"Sign in" in response.data
-    
-    def test_dashboard_loads_when_logged_in(self, client, test_user):
+    def test_dashboard_loads_when_logged_in(self, logged_in_client):
         """Test dashboard loads for logged-in users."""
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
-        response = client.get("/dashboard")
+        response = logged_in_client.get("/dashboard")
         assert response.status_code == 200
         assert b"Dashboard" in response.data
     
-    def test_dashboard_shows_empty_state(self, client, test_user):
+    def test_dashboard_shows_empty_state(self, logged_in_client):
         """Test dashboard shows empty state when no habits exist."""
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
-        response = client.get("/dashboard")
-        assert b"No habits" in response.data or b"first habit" in response.data
-    
-    def test_root_redirects_to_dashboard(self, client, test_user):
+        response = logged_in_client.get("/dashboard")
+        body = response.data
+        assert b"No habits" in body or b"first habit" in body
+
+    def test_dashboard_shows_habit_progress(self, logged_in_client, test_user):
+        """Test dashboard shows today's status and total completions per habit."""
+        done = Habit(user_id=test_user.id, name="Done Habit", frequency="daily")
+        pending = Habit(user_id=test_user.id, name="Pending Habit", frequency="daily")
+        db.session.add_all([done, pending])
+        db.session.flush()
+
+        db.session.execute(insert(HabitLog), [
+            {"habit_id": done.id, "date_completed": date.today()},
+            {"habit_id": done.id, "date_completed": date.today() - timedelta(days=1)},
+            {"habit_id": pending.id, "date_completed": date.today() - timedelta(days=1)},
+        ])
+        done.recompute_stats()
+        pending.recompute_stats()
+        db.session.commit()
+
+        response = logged_in_client.get("/dashboard")
+        assert response.status_code == 200
+        body = response.data
+        assert body.count(b"Done today") == 1
+        assert body.count(b"Not done") == 1
+        assert b"Total: 2" in body
+        assert b"Total: 1" in body
+
+    def test_dashboard_shows_completed_habit(self, logged_in_client, completed_habit):
+        """Test a habit completed today is shown as done on the dashboard."""
+        response = logged_in_client.get("/dashboard")
+        body = response.data
+        assert b"Done today" in body
+        assert b"Total: 1" in body
+
+    def test_root_redirects_to_dashboard(self, logged_in_client):
         """Test root URL redirects to dashboard when logged in."""
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
-        response = client.get("/", follow_redirects=False)
+        response = logged_in_client.get("/", follow_redirects=False)
         assert response.status_code in [200, 302]
 
 
@@ -182,37 +185,23 @@ class TestDashboard:
 class TestHabitManagement:
     """Test habit creation, reading, updating, and deletion."""
     
-    def test_add_habit_page_requires_login(self, client):
-        """Test add habit page requires authentication."""
-        response = client.get("/habit/new", follow_redirects=True)
-        assert b"Login" in response.data
-    
-    def test_add_habit_page_loads(self, client, test_user):
+    def test_add_habit_page_loads(self, logged_in_client):
         """Test add habit page loads correctly."""
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
-        response = client.get("/habit/new")
+        response = logged_in_client.get("/habit/new")
         assert response.status_code == 200
-        assert b"Add" in response.data or b"Habit" in response.data
+        body = response.data
+        assert b"Add" in body or b"Habit" in body
     
-    def test_create_habit_successfully(self, client, test_user):
+    def test_create_habit_successfully(self, logged_in_client):
         """Test creating a new habit."""
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
-        response = client.post("/habit/new", data={
+        response = logged_in_client.post("/habit/new", data={
             "name": "Morning Meditation",
             "description": "Meditate for 10 minutes",
             "frequency": "daily"
-        }, follow_redirects=True)
+        })
         
-        assert response.status_code == 200
-        assert b"Habit added" in response.data or b"Morning Meditation" in response.data
+        assert response.status_code == 302
+        assert "Habit added." in flashed_messages(logged_in_client)
         
         # Verify habit was created in database
         habit = Habit.query.filter_by(name="Morning Meditation").first()
@@ -220,121 +209,67 @@ class TestHabitManagement:
         assert habit.description == "Meditate for 10 minutes"
         assert habit.frequency == "daily"
     
-    def test_edit_habit_page_loads(self, client, test_user):
+    def test_edit_habit_page_loads(self, logged_in_client, sample_habit):
         """Test edit habit page loads correctly."""
-        # Login
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
-        # Create a habit first
-        habit = Habit(
-            user_id=test_user.id,
-            name="Test Habit",
-            description="Test Description",
-            frequency="daily"
-        )
-        db.session.add(habit)
-        db.session.commit()
-        habit_id = habit.id
-        
-        response = client.get(f"/habit/{habit_id}/edit")
+        response = logged_in_client.get(f"/habit/{sample_habit.id}/edit")
         assert response.status_code == 200
-        assert b"Edit" in response.data or b"Test Habit" in response.data
+        body = response.data
+        assert b"Edit" in body or b"Sample Habit" in body
     
-    def test_update_habit_successfully(self, client, test_user):
+    def test_update_habit_successfully(self, logged_in_client, sample_habit):
         """Test updating an existing habit."""
-        # Login
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
+        habit_id = sample_habit.id
         
-        # Create a habit first
-        habit = Habit(
-            user_id=test_user.id,
-            name="Original Name",
-            description="Original Description",
-            frequency="daily"
-        )
-        db.session.add(habit)
-        db.session.commit()
-        habit_id = habit.id
-        
-        response = client.post(f"/habit/{habit_id}/edit", data={
+        response = logged_in_client.post(f"/habit/{habit_id}/edit", data={
             "name": "Updated Name",
             "description": "Updated Description",
             "frequency": "weekly"
-        }, follow_redirects=True)
+        })
         
-        assert response.status_code == 200
-        assert b"Habit updated" in response.data or b"Updated Name" in response.data
+        assert response.status_code == 302
+        assert "Habit updated." in flashed_messages(logged_in_client)
         
         # Verify habit was updated in database
-        habit = Habit.query.get(habit_id)
+        habit = db.session.get(Habit, habit_id)
         assert habit.name == "Updated Name"
         assert habit.description == "Updated Description"
         assert habit.frequency == "weekly"
     
-    def test_delete_habit_successfully(self, client, test_user):
+    def test_delete_habit_successfully(self, logged_in_client, sample_habit):
         """Test deleting a habit."""
-        # Login
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
+        habit_id = sample_habit.id
         
-        # Create a habit first
-        habit = Habit(
-            user_id=test_user.id,
-            name="Habit to Delete",
-            description="Will be deleted",
-            frequency="daily"
-        )
-        db.session.add(habit)
-        db.session.commit()
-        habit_id = habit.id
-        
-        response = client.post(f"/habit/{habit_id}/delete", follow_redirects=True)
+        response = logged_in_client.post(f"/habit/{habit_id}/delete")
         
-        assert response.status_code == 200
-        assert b"Habit deleted" in response.data
+        assert response.status_code == 302
+        assert "Habit deleted." in flashed_messages(logged_in_client)
         
         # Verify habit was deleted from database
-        habit = Habit.query.get(habit_id)
+        habit = db.session.get(Habit, habit_id)
         assert habit is None
     
-    def test_cannot_edit_other_users_habit(self, client):
+    def test_cannot_edit_other_users_habit(self, client, two_users_with_habit):
         """Test user cannot edit another user's habit."""
-        # Create two users
-        user1 = User(name="User One", email="user1@example.com")
-        user1.set_password("pass123")
-        user2 = User(name="User Two", email="user2@example.com")
-        user2.set_password("pass123")
-        db.session.add_all([user1, user2])
-        db.session.commit()
-        
-        # Create habit for user1
-        habit = Habit(
-            user_id=user1.id,
-            name="User1's Habit",
-            description="Private habit",
-            frequency="daily"
-        )
-        db.session.add(habit)
-        db.session.commit()
-        habit_id = habit.id
+        _, user2, habit = two_users_with_habit
         
         # Login as user2
-        client.post("/login", data={
-            "email": "user2@example.com",
-            "password": "pass123"
-        })
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user2.id)
+        
+        # Try to edit user1's habit; it is indistinguishable from a missing one
+        response = client.get(f"/habit/{habit.id}/edit")
+        assert response.status_code == 404
+    
+    def test_cannot_delete_other_users_habit(self, client, two_users_with_habit):
+        """Test user cannot delete another user's habit."""
+        _, user2, habit = two_users_with_habit
         
-        # Try to edit user1's habit
-        response = client.get(f"/habit/{habit_id}/edit")
-        assert response.status_code == 403
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user2.id)
+        
+        response = client.post(f"/habit/{habit.id}/delete")
+        assert response.status_code == 404
+        assert db.session.get(Habit, habit.id) is not None
 
 
 # ============================================================================
@@ -344,14 +279,8 @@ class TestHabitManagement:
 class TestHabitCompletion:
     """Test habit completion tracking functionality."""
     
-    def test_mark_habit_complete(self, client, test_user):
+    def test_mark_habit_complete(self, logged_in_client, test_user):
         """Test marking a habit as complete."""
-        # Login
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
         # Create a habit
         habit = Habit(
             user_id=test_user.id,
@@ -363,10 +292,10 @@ class TestHabitCompletion:
         db.session.commit()
         habit_id = habit.id
         
-        response = client.post(f"/habit/{habit_id}/toggle", follow_redirects=True)
+        response = logged_in_client.post(f"/habit/{habit_id}/toggle")
         
-        assert response.status_code == 200
-        assert b"complete" in response.data.lower() or b"Marked" in response.data
+        assert response.status_code == 302
+        assert flashed_messages(logged_in_client) == [f"Marked 'Test Habit' complete for {date.today()}."]
         
         # Verify log was created
         log = HabitLog.query.filter_by(
@@ -375,14 +304,8 @@ class TestHabitCompletion:
         ).first()
         assert log is not None
     
-    def test_mark_habit_incomplete(self, client, test_user):
+    def test_mark_habit_incomplete(self, logged_in_client, test_user):
         """Test marking a completed habit as incomplete."""
-        # Login
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
         # Create a habit and mark it complete
         habit = Habit(
             user_id=test_user.id,
@@ -391,17 +314,18 @@ class TestHabitCompletion:
             frequency="daily"
         )
         db.session.add(habit)
-        db.session.commit()
+        db.session.flush()
         
         log = HabitLog(habit_id=habit.id, date_completed=date.today())
         db.session.add(log)
+        habit.recompute_stats()
         db.session.commit()
         habit_id = habit.id
         
-        response = client.post(f"/habit/{habit_id}/toggle", follow_redirects=True)
+        response = logged_in_client.post(f"/habit/{habit_id}/toggle")
         
-        assert response.status_code == 200
-        assert b"incomplete" in response.data.lower() or b"Marked" in response.data
+        assert response.status_code == 302
+        assert flashed_messages(logged_in_client) == [f"Marked 'Test Habit' incomplete for {date.today()}."]
         
         # Verify log was deleted
         log = HabitLog.query.filter_by(
@@ -410,14 +334,51 @@ class TestHabitCompletion:
         ).first()
         assert log is None
     
-    def test_view_habit_details(self, client, test_user):
+    def test_toggle_updates_cached_stats(self, logged_in_client, test_user):
+        """Test toggling keeps the habit's streak and total columns in step."""
+        today = date.today()
+        habit = Habit(user_id=test_user.id, name="Streak Habit", frequency="daily")
+        db.session.add(habit)
+        db.session.flush()
+        db.session.add(HabitLog(habit_id=habit.id, date_completed=today - timedelta(days=1)))
+        habit.recompute_stats()
+        db.session.commit()
+        assert (habit.streak_current, habit.total_completions) == (1, 1)
+
+        logged_in_client.post(f"/habit/{habit.id}/toggle")
+        db.session.expire_all()
+        assert (habit.streak_current, habit.total_completions) == (2, 2)
+        assert habit.last_completed == today
+        assert habit.streak_on(today) == 2
+
+        logged_in_client.post(f"/habit/{habit.id}/toggle")
+        db.session.expire_all()
+        assert (habit.streak_current, habit.total_completions) == (1, 1)
+        assert habit.last_completed == today - timedelta(days=1)
+        assert habit.streak_on(today) == 0
+
+    def test_untoggle_falls_back_to_latest_remaining_log(self, logged_in_client, test_user):
+        """Test unmarking a one-day streak points last_completed at the latest older log."""
+        today = date.today()
+        habit = Habit(user_id=test_user.id, name="Gap Habit", frequency="daily")
+        db.session.add(habit)
+        db.session.flush()
+        db.session.execute(insert(HabitLog), [
+            {"habit_id": habit.id, "date_completed": today - timedelta(days=3)},
+            {"habit_id": habit.id, "date_completed": today},
+        ])
+        habit.recompute_stats()
+        db.session.commit()
+        assert (habit.streak_current, habit.total_completions, habit.last_completed) == (1, 2, today)
+
+        logged_in_client.post(f"/habit/{habit.id}/toggle")
+        db.session.expire_all()
+        assert (habit.streak_current, habit.total_completions, habit.last_completed) == (
+            0, 1, today - timedelta(days=3)
+        )
+
+    def test_view_habit_details(self, logged_in_client, test_user):
         """Test viewing habit details page."""
-        # Login
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
         # Create a habit with some completion logs
         habit = Habit(
             user_id=test_user.id,
@@ -426,23 +387,154 @@ class TestHabitCompletion:
             frequency="daily"
         )
         db.session.add(habit)
-        db.session.commit()
+        db.session.flush()
         
         # Add some completion logs
-        for i in range(3):
-            log = HabitLog(
-                habit_id=habit.id,
-                date_completed=date.today() - timedelta(days=i)
-            )
-            db.session.add(log)
+        db.session.execute(insert(HabitLog), [
+            {"habit_id": habit.id, "date_completed": date.today() - timedelta(days=i)}
+            for i in range(3)
+        ])
+        habit.recompute_stats()
         db.session.commit()
         habit_id = habit.id
         
-        response = client.get(f"/habit/{habit_id}")
+        response = logged_in_client.get(f"/habit/{habit_id}")
         assert response.status_code == 200
-        assert b"Detailed Habit" in response.data
-        assert b"Habit with history" in response.data
-        assert b"Streak" in response.data or b"streak" in response.data
+        body = response.data
+        assert b"Detailed Habit" in body
+        assert b"Habit with history" in body
+        assert b"Streak" in body or b"streak" in body
+        assert b"3 days" in body
+        assert date.today().strftime("%B %d, %Y").encode() in body
+
+    def test_toggle_insert_compiles_for_postgres(self):
+        """Test the completion insert renders ON CONFLICT ... RETURNING on Postgres."""
+        dialect = postgresql.dialect()
+        stmt = routes._insert_log_stmt(dialect, 1, date.today())
+        sql = " ".join(str(stmt.compile(dialect=dialect)).split())
+        assert sql.endswith(
+            "ON CONFLICT (habit_id, date_completed) DO NOTHING RETURNING habit_logs.id"
+        )
+
+    def test_toggle_insert_falls_back_to_plain_insert(self):
+        """Test other backends get a portable INSERT instead of SQLite syntax."""
+        dialect = mysql.dialect()
+        sql = str(routes._insert_log_stmt(dialect, 1, date.today()).compile(dialect=dialect))
+        assert sql.startswith("INSERT INTO habit_logs")
+        assert "ON CONFLICT" not in sql and "RETURNING" not in sql
+
+    def test_toggle_round_trip_without_on_conflict(self, logged_in_client, sample_habit, monkeypatch):
+        """Test the IntegrityError fallback toggles a log on and off again."""
+        # treat SQLite like a backend without ON CONFLICT support
+        monkeypatch.setattr(routes, "_DIALECT_INSERTS", {})
+        habit_id = sample_habit.id
+
+        logged_in_client.post(f"/habit/{habit_id}/toggle")
+        assert HabitLog.query.filter_by(habit_id=habit_id).count() == 1
+        assert db.session.get(Habit, habit_id).total_completions == 1
+
+        logged_in_client.post(f"/habit/{habit_id}/toggle")
+        assert HabitLog.query.filter_by(habit_id=habit_id).count() == 0
+        assert db.session.get(Habit, habit_id).total_completions == 0
+
+
+# ============================================================================
+# Postgres Tests
+# ============================================================================
+
+@pytest.mark.postgres
+class TestPostgres:
+    """Test the dialect-specific toggle path against a real Postgres server."""
+
+    @pytest.fixture(autouse=True)
+    def db_session(self, pg_db_session):
+        # replaces the SQLite db_session for this class
+        return pg_db_session
+
+    def test_toggle_round_trip(self, pg_app):
+        """Test toggling inserts once, ignores the conflict path, and deletes again."""
+        user = User(name="PG User", email="pg@example.com")
+        user.set_password("pass123")
+        db.session.add(user)
+        db.session.flush()
+        habit = Habit(user_id=user.id, name="PG Habit", frequency="daily")
+        db.session.add(habit)
+        db.session.commit()
+
+        client = pg_app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user.id)
+
+        assert client.post(f"/habit/{habit.id}/toggle").status_code == 302
+        db.session.expire_all()
+        assert HabitLog.query.filter_by(habit_id=habit.id).count() == 1
+        assert (habit.total_completions, habit.last_completed) == (1, date.today())
+
+        # a second insert for the same day hits ON CONFLICT DO NOTHING
+        assert routes._insert_log_if_missing(habit.id, date.today()) is None
+
+        assert client.post(f"/habit/{habit.id}/toggle").status_code == 302
+        db.session.expire_all()
+        assert HabitLog.query.filter_by(habit_id=habit.id).count() == 0
+        assert (habit.total_completions, habit.last_completed) == (0, None)
+
+
+# ============================================================================
+# Query Count Tests
+# ============================================================================
+
+class TestQueryCounts:
+    """Test page queries do not grow with the number of habits or logs."""
+
+    def _add_habits(self, user_id, count):
+        habits = [Habit(user_id=user_id, name=f"Habit {i}", frequency="daily") for i in range(count)]
+        db.session.add_all(habits)
+        db.session.flush()
+        db.session.execute(insert(HabitLog), [
+            {"habit_id": h.id, "date_completed": date.today() - timedelta(days=i)}
+            for h in habits for i in range(3)
+        ])
+        for h in habits:
+            h.recompute_stats()
+        db.session.commit()
+        return habits
+
+    def test_dashboard_query_count_is_constant(self, logged_in_client, test_user, select_counter):
+        """Test the dashboard issues the same number of SELECTs for 1 or 10 habits."""
+        self._add_habits(test_user.id, 1)
+        select_counter.clear()
+        logged_in_client.get("/dashboard")
+        one_habit = len(select_counter)
+        assert one_habit > 0
+
+        self._add_habits(test_user.id, 9)
+        select_counter.clear()
+        response = logged_in_client.get("/dashboard")
+        assert response.data.count(b"Done today") == 10
+        assert len(select_counter) == one_habit
+
+    def test_view_habit_query_count_is_constant(self, logged_in_client, test_user, select_counter):
+        """Test the habit page issues the same number of SELECTs regardless of history."""
+        short_habit, = self._add_habits(test_user.id, 1)
+        select_counter.clear()
+        logged_in_client.get(f"/habit/{short_habit.id}")
+        short_history = len(select_counter)
+        assert short_history > 0
+
+        long_habit = Habit(user_id=test_user.id, name="Long Habit", frequency="daily")
+        db.session.add(long_habit)
+        db.session.flush()
+        db.session.execute(insert(HabitLog), [
+            {"habit_id": long_habit.id, "date_completed": date.today() - timedelta(days=i)}
+            for i in range(90)
+        ])
+        long_habit.recompute_stats()
+        db.session.commit()
+
+        select_counter.clear()
+        response = logged_in_client.get(f"/habit/{long_habit.id}")
+        assert b"90 days" in response.data
+        assert len(select_counter) == short_history
 
 
 # ============================================================================
@@ -460,6 +552,48 @@ class TestModels:
         assert user.password_hash != "mypassword"
         assert user.check_password("mypassword")
         assert not user.check_password("wrongpassword")
+
+    def test_password_hash_cost_comes_from_config(self):
+        """Test PASSWORD_HASH_* settings reach the hashes that get stored."""
+        user = User(name="Test", email="test@example.com")
+        user.set_password("mypassword")
+        # TEST_CONFIG lowers the cost to t=1, m=8 KiB, p=1
+        assert "$m=8,t=1,p=1$" in user.password_hash
+
+    def test_password_hashing_works_without_app_context(self):
+        """Test set_password/check_password fall back to the default cost outside an app context."""
+        user = User(name="Test", email="test@example.com")
+        verified = []
+
+        def hash_and_check():
+            user.set_password("mypassword")
+            verified.append(user.check_password("mypassword"))
+
+        # a new thread starts without the test's app context
+        worker = threading.Thread(target=hash_and_check)
+        worker.start()
+        worker.join()
+        assert verified == [True]
+        assert "$m=65536,t=2,p=1$" in user.password_hash
+
+    def test_legacy_password_hash_is_upgraded(self):
+        """Test legacy Werkzeug hashes still verify and are rehashed with argon2."""
+        user = User(name="Test", email="test@example.com")
+        user.password_hash = generate_password_hash("mypassword", method="pbkdf2:sha256:1000")
+
+        assert not user.check_password("wrongpassword")
+        assert user.password_hash.startswith("pbkdf2:")
+        assert user.check_password("mypassword")
+        assert user.password_hash.startswith("$argon2")
+        assert user.check_password("mypassword")
+
+    def test_unknown_password_hash_scheme_is_rejected(self):
+        """Test hashes in an unsupported or malformed format never verify."""
+        user = User(name="Test", email="test@example.com")
+        for stored in ["", "mypassword", "md5$abc$def", "$bcrypt$xyz"]:
+            user.password_hash = stored
+            assert not user.check_password("mypassword")
+            assert user.password_hash == stored
     
     def test_habit_completed_on_method(self, test_user):
         """Test habit's completed_on method."""
@@ -469,7 +603,7 @@ class TestModels:
             frequency="daily"
         )
         db.session.add(habit)
-        db.session.commit()
+        db.session.flush()
         
         today = date.today()
         yesterday = today - timedelta(days=1)
@@ -484,6 +618,11 @@ class TestModels:
         
         assert habit.completed_on(today)
         assert not habit.completed_on(yesterday)
+
+        # Same answers once the logs collection is loaded
+        assert len(habit.logs) == 1
+        assert habit.completed_on(today)
+        assert not habit.completed_on(yesterday)
     
     def test_habit_completion_count(self, test_user):
         """Test habit's completion_count method."""
@@ -493,21 +632,48 @@ class TestModels:
             frequency="daily"
         )
         db.session.add(habit)
-        db.session.commit()
+        db.session.flush()
         
         assert habit.completion_count() == 0
         
         # Add some completions
-        for i in range(5):
-            log = HabitLog(
-                habit_id=habit.id,
-                date_completed=date.today() - timedelta(days=i)
-            )
-            db.session.add(log)
+        db.session.execute(insert(HabitLog), [
+            {"habit_id": habit.id, "date_completed": date.today() - timedelta(days=i)}
+            for i in range(5)
+        ])
         db.session.commit()
         
         assert habit.completion_count() == 5
     
+    @staticmethod
+    def _query_plan(stmt, **params):
+        """EXPLAIN QUERY PLAN for a statement exactly as the app compiles it."""
+        compiled = stmt.compile(dialect=db.engine.dialect)
+        values = compiled.construct_params(params)
+        args = tuple(values[name] for name in compiled.positiontup)
+        rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", args)
+        return [row[-1] for row in rows]
+
+    def test_hot_lookups_use_unique_indexes(self, db_session):
+        """Test login and completion lookups are served by the unique indexes."""
+        # SQLite names unique-constraint indexes sqlite_autoindex_<table>_N;
+        # on habit_logs that is _habit_date_uc (habit_id, date_completed)
+        columns = db.session.execute(text("PRAGMA index_info(sqlite_autoindex_habit_logs_1)")).all()
+        assert [row[2] for row in columns] == ["habit_id", "date_completed"]
+
+        login = self._query_plan(User.query.filter_by(email="x").limit(1).statement)
+        assert login == ["SEARCH users USING INDEX sqlite_autoindex_users_1 (email=?)"]
+
+        completed_on = self._query_plan(models._SEL_LOG_FOR_DAY, hid=1, day=date.today())
+        assert completed_on == [
+            "SEARCH habit_logs USING COVERING INDEX sqlite_autoindex_habit_logs_1 "
+            "(habit_id=? AND date_completed=?)"
+        ]
+
+        # newest-first comes straight off the index, with no sort step
+        history = self._query_plan(routes._SEL_HISTORY, hid=1)
+        assert history == ["SEARCH habit_logs USING COVERING INDEX sqlite_autoindex_habit_logs_1 (habit_id=?)"]
+
     def test_habit_cascade_delete(self, test_user):
         """Test that deleting a habit deletes its logs."""
         habit = Habit(
@@ -516,15 +682,13 @@ class TestModels:
             frequency="daily"
         )
         db.session.add(habit)
-        db.session.commit()
+        db.session.flush()
         
         # Add some logs
-        for i in range(3):
-            log = HabitLog(
-                habit_id=habit.id,
-                date_completed=date.today() - timedelta(days=i)
-            )
-            db.session.add(log)
+        db.session.execute(insert(HabitLog), [
+            {"habit_id": habit.id, "date_completed": date.today() - timedelta(days=i)}
+            for i in range(3)
+        ])
         db.session.commit()
         
         habit_id = habit.id
@@ -547,19 +711,24 @@ class TestModels:
 class TestProfile:
     """Test user profile functionality."""
     
-    def test_profile_page_requires_login(self, client):
-        """Test profile page requires authentication."""
-        response = client.get("/profile", follow_redirects=True)
-        assert b"Login" in response.data
-    
-    def test_profile_page_loads(self, client, test_user):
+    def test_profile_page_loads(self, logged_in_client):
         """Test profile page loads for logged-in users."""
-        client.post("/login", data={
-            "email": "test@example.com",
-            "password": "testpass123"
-        })
-        
-        response = client.get("/profile")
+        response = logged_in_client.get("/profile")
         assert response.status_code == 200
-        assert b"Profile" in response.data
-        assert b"Test User" in response.data or b"test@example.com" in response.data
\ No newline at end of file
+        body = response.data
+        assert b"Profile" in body
+        assert b"Test User" in body or b"test@example.com" in body
+
+
+# ============================================================================
+# Utility Tests
+# ============================================================================
+
+class TestUtils:
+    """Test helper functions."""
+
+    def test_last_n_days(self):
+        """Test last_n_days returns the last n dates, newest first, and is cached."""
+        days = last_n_days(3)
+        assert days == (date.today(), date.today() - timedelta(days=1), date.today() - timedelta(days=2))
+        assert last_n_days(3) is days